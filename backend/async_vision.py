@@ -1,34 +1,128 @@
 import asyncio
 import time
+from typing_extensions import TypedDict
 import google.generativeai as genai
-from config import settings
+from config import MAX_CAPTION_BATCH_SIZE, settings
+from gemini_settings import configure_gemini, generate_content
+from state_store import ImageStateStore
 import sys
 import json
 
-genai.configure(api_key=settings.GEMINI_API_KEY)
+configure_gemini()
+
+MODEL_NAME = "gemini-1.5-flash-002"
+
+# Gemini 1.5 Flash pricing in USD per million tokens (prompts up to 128k tokens)
+INPUT_PRICE_PER_MILLION = 0.075
+OUTPUT_PRICE_PER_MILLION = 0.30
+
+# Output token budget per caption, and Gemini 1.5 Flash's limit per response
+CAPTION_OUTPUT_TOKENS = 512
+MAX_OUTPUT_TOKENS = 8192
 
 prompt = "Describe the image in a detailed unformatted paragraph. Don't mention the Google logo."
 
+batch_prompt = (
+    "Each image above is preceded by its image ID. Describe every image in a "
+    "detailed unformatted paragraph. Don't mention the Google logo. Return exactly "
+    "one caption per image ID."
+)
+
 generation_config = genai.GenerationConfig(
     temperature=0,
     top_p=0.95,
     top_k=40,
-    max_output_tokens=512,
+    max_output_tokens=CAPTION_OUTPUT_TOKENS,
     response_mime_type="text/plain",
 )
 
 
+class ImageCaption(TypedDict):
+    id: str
+    caption: str
+
+
+def batch_generation_config(batch_size):
+    return genai.GenerationConfig(
+        temperature=0,
+        top_p=0.95,
+        top_k=40,
+        max_output_tokens=min(CAPTION_OUTPUT_TOKENS * batch_size, MAX_OUTPUT_TOKENS),
+        response_mime_type="application/json",
+        response_schema=list[ImageCaption],
+    )
+
+
+# Token usage across all requests made by this process, for cost reporting
+usage = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+
+def record_usage(response):
+    usage["requests"] += 1
+    usage["prompt_tokens"] += response.usage_metadata.prompt_token_count
+    usage["output_tokens"] += response.usage_metadata.candidates_token_count
+
+
+def usage_report(captions, elapsed):
+    cost = (
+        usage["prompt_tokens"] * INPUT_PRICE_PER_MILLION
+        + usage["output_tokens"] * OUTPUT_PRICE_PER_MILLION
+    ) / 1_000_000
+    return {
+        "captions": captions,
+        "requests": usage["requests"],
+        "captions_per_second": round(captions / elapsed, 2) if elapsed else 0,
+        "cost_per_image_usd": cost / captions if captions else 0,
+    }
+
+
 def process_caption(caption):
     return caption.split(":")[-1].replace("\n", " ").strip()
 
 
+def parse_batch_captions(text, image_ids):
+    """
+    Map image URLs to captions from a batched JSON response. Items with an unknown
+    or repeated ID, or without a usable caption, are left out so they fall back
+    to single-image requests.
+    """
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(items, list):
+        return {}
+
+    captions = {}
+    repeated = set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        image_id, caption = item.get("id"), item.get("caption")
+        if image_id not in image_ids or not isinstance(caption, str):
+            continue
+        caption = process_caption(caption)
+        if not caption:
+            continue
+        if image_id in captions:
+            repeated.add(image_id)
+        captions[image_id] = caption
+
+    return {
+        image_ids[image_id]: caption
+        for image_id, caption in captions.items()
+        if image_id not in repeated
+    }
+
+
 async def generate_caption(image_url, file_name):
     try:
         model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash-002", generation_config=generation_config
+            model_name=MODEL_NAME, generation_config=generation_config
         )
         file = genai.get_file(file_name)
-        response = await model.generate_content_async([file, "\n\n", prompt])
+        response = await generate_content(model, [file, "\n\n", prompt])
+        record_usage(response)
         caption = process_caption(response.text)
         return {"image_url": image_url, "description": caption}
     except Exception as e:
@@ -36,25 +130,87 @@ async def generate_caption(image_url, file_name):
         return {"image_url": image_url, "description": None, "error": str(e)}
 
 
-async def main(image_urls):
+async def generate_batch_captions(batch):
+    """
+    Caption several images with one request, returning {image_url: caption} for
+    the images that got a valid caption.
+    """
+    model = genai.GenerativeModel(
+        model_name=MODEL_NAME, generation_config=batch_generation_config(len(batch))
+    )
+    image_ids = {}
+    contents = []
+    for i, (image_url, file_name) in enumerate(batch, 1):
+        image_id = f"image_{i}"
+        image_ids[image_id] = image_url
+        contents += [f"Image ID: {image_id}", genai.get_file(file_name)]
+    contents += ["\n\n", batch_prompt]
+
+    response = await generate_content(model, contents)
+    record_usage(response)
+    return parse_batch_captions(response.text, image_ids)
+
+
+async def caption_batch(batch):
+    """
+    Caption a batch of (image_url, file_name) pairs with one request, retrying
+    any image the batched response didn't cover with a single-image request.
+    """
+    if len(batch) == 1:
+        return [await generate_caption(*batch[0])]
+
+    try:
+        captions = await generate_batch_captions(batch)
+    except Exception as e:
+        print(f"Batched request for {len(batch)} images failed: {e}", file=sys.stderr)
+        captions = {}
+
+    fallbacks = [(url, file_name) for url, file_name in batch if url not in captions]
+    if fallbacks:
+        print(
+            f"Falling back to single requests for {len(fallbacks)} images",
+            file=sys.stderr,
+        )
+    fallback_responses = await asyncio.gather(
+        *(generate_caption(url, file_name) for url, file_name in fallbacks)
+    )
+    responses = {response["image_url"]: response for response in fallback_responses}
+
+    return [
+        responses.get(url) or {"image_url": url, "description": captions[url]}
+        for url, _ in batch
+    ]
+
+
+async def main(image_urls, batch_size=settings.CAPTION_BATCH_SIZE):
+    if not 1 <= batch_size <= MAX_CAPTION_BATCH_SIZE:
+        raise ValueError(
+            f"Caption batch size must be between 1 and {MAX_CAPTION_BATCH_SIZE}"
+        )
     start_time = time.time()
 
-    with open("image_mappings.json", "r") as f:
-        image_to_file = json.load(f)
+    with ImageStateStore() as store:
+        image_to_file = store.file_names(image_urls)
 
     print("Generating captions...", file=sys.stderr)
+    items = [(url, image_to_file[url]) for url in image_urls if url in image_to_file]
     caption_tasks = [
-        generate_caption(url, image_to_file[url])
-        for url in image_urls
-        if url in image_to_file
+        caption_batch(items[i : i + batch_size])
+        for i in range(0, len(items), batch_size)
+    ]
+    responses = [
+        response
+        for batch_responses in await asyncio.gather(*caption_tasks)
+        for response in batch_responses
     ]
-    responses = await asyncio.gather(*caption_tasks)
     print("Captions generated.", file=sys.stderr)
 
     end_time = time.time()
     print(
         f"\nTotal execution time: {end_time - start_time:.2f} seconds", file=sys.stderr
     )
+    captioned = len([response for response in responses if response["description"]])
+    print(f"Usage: {usage_report(captioned, end_time - start_time)}", file=sys.stderr)
 
     return responses
 
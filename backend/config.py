@@ -1,6 +1,10 @@
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
 
+# 512 output tokens per caption must fit Gemini 1.5 Flash's 8192 token limit
+MAX_CAPTION_BATCH_SIZE = 16
+
 
 class Settings(BaseSettings):
     COHERE_API_KEY: str
@@ -9,6 +13,25 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str
     DB_CONNECTION_STRING: str
     BACKEND_URL: str
+    # Overridable so the benchmark can point the clients at local stand-ins
+    COHERE_BASE_URL: str = "https://api.cohere.com"
+    GEMINI_API_ENDPOINT: str = ""
+    # Images per Gemini captioning request; 1 sends one request per image
+    CAPTION_BATCH_SIZE: int = Field(1, ge=1, le=MAX_CAPTION_BATCH_SIZE)
+    # Query/caption embedding: "cohere" or "local" (ONNX model on CPU)
+    EMBEDDING_PROVIDER: str = "cohere"
+    # Searched instead when the main provider fails; its collection must be populated
+    EMBEDDING_FALLBACK_PROVIDER: str = ""
+    LOCAL_EMBEDDING_MODEL: str = "Xenova/bge-small-en-v1.5"
+    LOCAL_EMBEDDING_ONNX_FILE: str = "onnx/model_quantized.onnx"
+    LOCAL_EMBEDDING_QUERY_PREFIX: str = (
+        "Represent this sentence for searching relevant passages: "
+    )
+    LOCAL_EMBEDDING_POOLING: str = "cls"
+    # Split vectors into one collection per lat/lon tile (see partitions.py)
+    VECTOR_PARTITIONING: bool = False
+    # Tile edge in degrees; changing it needs a re-split of existing partitions
+    PARTITION_TILE_DEGREES: float = 0.1
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
@@ -0,0 +1,150 @@
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+
+import cohere
+import numpy as np
+from config import settings
+
+
+class EmbeddingProvider(ABC):
+    """
+    Turns text into vectors in one vector space. Each provider's vectors live in
+    their own collection, since vectors from different models can't be compared.
+    """
+
+    name = ""
+    collection_name = ""
+    dimension = 0
+    # Texts per embedding call when embedding captions
+    batch_size = 96
+
+    @abstractmethod
+    def embed_queries(self, texts):
+        """Embed search queries, returning one vector per text."""
+
+    @abstractmethod
+    def embed_documents(self, texts):
+        """Embed captions for storage, returning one vector per text."""
+
+
+class CohereProvider(EmbeddingProvider):
+    name = "cohere"
+    collection_name = "image_embeddings"
+    dimension = 1024
+    batch_size = 96
+    model = "embed-english-v3.0"
+
+    def __init__(self):
+        self.client = cohere.ClientV2(
+            settings.COHERE_API_KEY, base_url=settings.COHERE_BASE_URL
+        )
+
+    def _embed(self, texts, input_type):
+        response = self.client.embed(
+            texts=texts,
+            model=self.model,
+            input_type=input_type,
+            embedding_types=["float"],
+        )
+        return response.embeddings.float
+
+    def embed_queries(self, texts):
+        return self._embed(texts, "search_query")
+
+    def embed_documents(self, texts):
+        return self._embed(texts, "search_document")
+
+
+class LocalOnnxProvider(EmbeddingProvider):
+    """
+    A sentence-embedding model run on CPU with onnxruntime, by default the
+    int8-quantized bge-small-en-v1.5 (384-d). The model is a Hugging Face repo id
+    or a local directory holding tokenizer.json and the ONNX file.
+    """
+
+    name = "local"
+    batch_size = 32
+    max_length = 512
+
+    def __init__(
+        self,
+        model=settings.LOCAL_EMBEDDING_MODEL,
+        onnx_file=settings.LOCAL_EMBEDDING_ONNX_FILE,
+        query_prefix=settings.LOCAL_EMBEDDING_QUERY_PREFIX,
+        pooling=settings.LOCAL_EMBEDDING_POOLING,
+    ):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError(
+                "The local embedding provider needs onnxruntime: pip install onnxruntime"
+            )
+        from tokenizers import Tokenizer
+
+        model_path = self._resolve(model, onnx_file)
+        tokenizer_path = self._resolve(model, "tokenizer.json")
+
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding()
+
+        self.session = onnxruntime.InferenceSession(
+            str(model_path), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+        self.query_prefix = query_prefix
+        self.pooling = pooling
+        slug = re.sub(r"[^a-z0-9]+", "_", Path(model).name.lower()).strip("_")
+        self.collection_name = f"image_embeddings_{slug}"
+
+    @staticmethod
+    def _resolve(model, file_name):
+        if Path(model).is_dir():
+            return Path(model) / file_name
+        from huggingface_hub import hf_hub_download
+
+        return hf_hub_download(model, file_name)
+
+    def _embed(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array(
+            [encoding.attention_mask for encoding in encodings], dtype=np.int64
+        )
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden_states = self.session.run(None, feeds)[0]
+        if self.pooling == "cls":
+            pooled = hidden_states[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden_states * mask).sum(axis=1) / mask.sum(axis=1)
+        pooled /= np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled.tolist()
+
+    def embed_queries(self, texts):
+        return self._embed([self.query_prefix + text for text in texts])
+
+    def embed_documents(self, texts):
+        return self._embed(texts)
+
+
+PROVIDERS = {
+    CohereProvider.name: CohereProvider,
+    LocalOnnxProvider.name: LocalOnnxProvider,
+}
+
+
+@lru_cache()
+def get_embedding_provider(name=None):
+    name = name or settings.EMBEDDING_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(
+            f"Unknown embedding provider {name!r}, expected one of {list(PROVIDERS)}"
+        )
+    return PROVIDERS[name]()
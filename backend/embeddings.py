@@ -1,14 +1,23 @@
-import cohere
+import argparse
 import vecs
 import requests
 from config import settings
+from embedding_providers import PROVIDERS, get_embedding_provider
+from partitions import (
+    create_indexes,
+    parse_bbox,
+    partition_name,
+    tile_bounds,
+    tile_for,
+)
 import numpy as np
 import time
 
 
-def load_captions():
+def load_captions(bbox=None):
     response = requests.get(
-        f"{settings.BACKEND_URL}/street_view_images_with_description"
+        f"{settings.BACKEND_URL}/street_view_images_with_description",
+        params=bbox._asdict() if bbox else None,
     )
     if response.status_code == 200:
         return response.json()
@@ -16,54 +25,135 @@ def load_captions():
         raise Exception(f"Failed to load captions: {response.status_code}")
 
 
-def save_embeddings(image_ids, embeddings):
-    with vecs.create_client(settings.DB_CONNECTION_STRING) as vx:
-        docs = vx.get_or_create_collection(name="image_embeddings", dimension=1024)
-        # docs contains :
-        # vector[0]: uuid -> same as image uuid
-        # vector[1]: embedding -> the float embeddings
+def collection_for(provider, meta):
+    """
+    The collection a vector belongs in: its tile's partition when partitioning
+    is on, which needs the image coordinates, or else the provider's collection.
+    """
+    if not settings.VECTOR_PARTITIONING:
+        return provider.collection_name
+    if "latitude" not in meta or "longitude" not in meta:
+        return None
+    return partition_name(
+        provider.collection_name, tile_for(meta["latitude"], meta["longitude"])
+    )
 
-        records = []
-        for image_id, embedding in zip(image_ids, embeddings):
-            records.append((image_id, np.array(embedding), {}))
 
-        docs.upsert(records)
+def save_embeddings(provider, image_ids, embeddings, metadata):
+    """
+    Upsert the embeddings, returning the names of the collections written to.
+    """
+    # records per collection, each contains :
+    # vector[0]: uuid -> same as image uuid
+    # vector[1]: embedding -> the float embeddings
+    # vector[2]: metadata -> image coordinates, used by the heatmap tiles and partitions
+    records = {}
+    for image_id, embedding, meta in zip(image_ids, embeddings, metadata):
+        name = collection_for(provider, meta)
+        if name is None:
+            print(f"Skipping {image_id}: no coordinates to pick a partition")
+            continue
+        records.setdefault(name, []).append((image_id, np.array(embedding), meta))
 
+    with vecs.create_client(settings.DB_CONNECTION_STRING) as vx:
+        for name, collection_records in records.items():
+            docs = vx.get_or_create_collection(name=name, dimension=provider.dimension)
+            docs.upsert(collection_records)
 
-def main():
-    co = cohere.ClientV2(settings.COHERE_API_KEY)
-    captions = load_captions()
+    return set(records)
 
-    batch_size = 96
 
+def embed_captions(provider, captions):
+    """
+    Embed and save the captions, returning the names of the collections written to.
+    """
+    collections = set()
+    batch_size = provider.batch_size
     for i in range(0, len(captions), batch_size):
         batch_start_time = time.time()
         batch = captions[i : i + batch_size]
         image_ids = [caption["image_id"] for caption in batch]
         batch_texts = [caption["description"] for caption in batch]
+        metadata = [
+            {
+                key: caption[key]
+                for key in ("latitude", "longitude")
+                if caption.get(key) is not None
+            }
+            for caption in batch
+        ]
 
-        response = co.embed(
-            texts=batch_texts,
-            model="embed-english-v3.0",
-            input_type="search_document",
-            embedding_types=["float"],
-        )
+        embeddings = provider.embed_documents(batch_texts)
 
-        save_embeddings(image_ids, response.embeddings.float)
+        collections |= save_embeddings(provider, image_ids, embeddings, metadata)
 
         batch_end_time = time.time()
         batch_duration = batch_end_time - batch_start_time
         print(f"Batch {i // batch_size + 1} completed in {batch_duration:.2f} seconds.")
 
+    return collections
+
+
+def main(provider_name=None, tile=None, bbox=None):
+    """
+    Embed the captioned images in `bbox` (the API's default area if None), or
+    with `tile` only that partition's images, then (re)build the HNSW index of
+    each collection written to.
+    """
+    provider = get_embedding_provider(provider_name)
+    if tile is None:
+        captions = load_captions(bbox)
+    else:
+        # Bounds are inclusive, so drop images on the edge of a neighbouring tile
+        captions = [
+            caption
+            for caption in load_captions(tile_bounds(tile))
+            if tile_for(caption["latitude"], caption["longitude"]) == tile
+        ]
+
+    print(f"Embedding {len(captions)} captions into {provider.collection_name}")
+    collections = embed_captions(provider, captions)
+
     with vecs.create_client(settings.DB_CONNECTION_STRING) as vx:
-        docs = vx.get_or_create_collection(name="image_embeddings", dimension=1024)
-        docs.create_index(
-            method=vecs.IndexMethod.hnsw,
-            measure=vecs.IndexMeasure.cosine_distance,
+        create_indexes(
+            [
+                vx.get_or_create_collection(name=name, dimension=provider.dimension)
+                for name in sorted(collections)
+            ]
         )
 
     print("Embeddings saved!")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--provider",
+        choices=list(PROVIDERS),
+        help="Embedding model to (re-)embed captions with; defaults to EMBEDDING_PROVIDER",
+    )
+    area = parser.add_mutually_exclusive_group()
+    area.add_argument(
+        "--bbox",
+        type=parse_bbox,
+        metavar="S,W,N,E",
+        help="Embed the captioned images in this area; defaults to the API's downtown box",
+    )
+    area.add_argument(
+        "--partition",
+        metavar="X_Y",
+        help="Only re-embed and re-index this partition tile (needs VECTOR_PARTITIONING)",
+    )
+    args = parser.parse_args()
+
+    tile = None
+    if args.partition:
+        if not settings.VECTOR_PARTITIONING:
+            parser.error("--partition needs VECTOR_PARTITIONING=true")
+        try:
+            tile = tuple(int(index) for index in args.partition.split("_"))
+        except ValueError:
+            tile = ()
+        if len(tile) != 2:
+            parser.error("--partition must look like 1234_567")
+    main(args.provider, tile, args.bbox)
@@ -0,0 +1,479 @@
+"""
+Local stand-ins for the Cohere embed, Gemini file/generate and Supabase PostgREST
+APIs so the search API and the vision/embedding pipelines can be benchmarked
+without calling paid external services.
+
+All three APIs are served from one FastAPI app. Each service has its own latency,
+jitter and error-rate profile, and the rows served by the PostgREST stand-in are
+generated deterministically from (rows, dimension, seed) so that a separate
+process (see benchmark.py) can rebuild the exact same dataset.
+
+Run standalone with:
+    python fake_services.py --rows 500000 --latency cohere=120 --error-rate gemini=0.01
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+
+# Downtown bounding box used by the search API endpoints
+LONGITUDE_MIN = -79.403619
+LONGITUDE_MAX = -79.374303
+LATITUDE_MIN = 43.637794
+LATITUDE_MAX = 43.670535
+
+EMBEDDING_DIMENSION = 1024
+CHUNK_SIZE = 10_000
+
+# Supabase caps unbounded selects at 1000 rows by default
+POSTGREST_MAX_ROWS = 1000
+
+# Rough Gemini token accounting: one image costs a fixed number of prompt tokens
+GEMINI_TOKENS_PER_IMAGE = 258
+
+VOCABULARY = (
+    "street sidewalk tree bench storefront cafe bicycle car bus streetcar "
+    "pedestrian brick building window awning sign graffiti mural flowers "
+    "violet red green blue parked traffic light crosswalk condo tower glass "
+    "fence construction crane alley lamp post hydrant market patio umbrella "
+    "church steeple park grass snow rain sunny cloudy shadow reflection "
+    "billboard restaurant bakery bridge rusty railing stairs door balcony"
+).split()
+
+
+@dataclass
+class ServiceProfile:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    async def simulate(self):
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            raise HTTPException(status_code=503, detail="Injected failure")
+
+
+def text_embedding(text, dimension=EMBEDDING_DIMENSION):
+    """
+    Deterministic unit-norm embedding for a piece of text.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    rng = np.random.default_rng(int.from_bytes(digest[:8], "little"))
+    vector = rng.standard_normal(dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def synthetic_description(index, words=60):
+    return " ".join(
+        VOCABULARY[(index * 7919 + k * 104729 + k * k) % len(VOCABULARY)]
+        for k in range(words)
+    )
+
+
+@dataclass
+class SyntheticDataset:
+    """
+    A synthetic street_view_images table plus its 1024-d embeddings.
+
+    Row i has image_id UUID(int=i + 1), so ids map back to row indices without a
+    lookup table. Embeddings are generated chunk by chunk from (seed, chunk), which
+    lets large datasets be streamed into Postgres without holding them in memory.
+    """
+
+    rows: int
+    dimension: int = EMBEDDING_DIMENSION
+    seed: int = 0
+    described_fraction: float = 0.9
+    latitudes: np.ndarray = field(init=False, repr=False)
+    longitudes: np.ndarray = field(init=False, repr=False)
+    described: np.ndarray = field(init=False, repr=False)
+    description_overrides: Dict[int, Optional[str]] = field(
+        init=False, repr=False, default_factory=dict
+    )
+
+    def __post_init__(self):
+        rng = np.random.default_rng(self.seed)
+        self.latitudes = rng.uniform(LATITUDE_MIN, LATITUDE_MAX, self.rows)
+        self.longitudes = rng.uniform(LONGITUDE_MIN, LONGITUDE_MAX, self.rows)
+        self.described = rng.random(self.rows) < self.described_fraction
+
+    @staticmethod
+    def image_id(index):
+        return str(uuid.UUID(int=index + 1))
+
+    def index_of(self, image_id):
+        try:
+            index = uuid.UUID(str(image_id)).int - 1
+        except ValueError:
+            return None
+        return index if 0 <= index < self.rows else None
+
+    @staticmethod
+    def image_url(index):
+        return f"https://images.fake.local/street_view/{index}.jpg"
+
+    def index_of_url(self, image_url):
+        match = re.search(r"/street_view/(\d+)\.jpg$", image_url)
+        if not match:
+            return None
+        index = int(match.group(1))
+        return index if 0 <= index < self.rows else None
+
+    def description(self, index):
+        if index in self.description_overrides:
+            return self.description_overrides[index]
+        return synthetic_description(index) if self.described[index] else None
+
+    def row(self, index):
+        return {
+            "image_id": self.image_id(index),
+            "image_url": self.image_url(index),
+            "latitude": float(self.latitudes[index]),
+            "longitude": float(self.longitudes[index]),
+            "description": self.description(index),
+        }
+
+    def embedding_chunks(self, chunk_size=CHUNK_SIZE):
+        """
+        Yield (start, unit-norm float32 matrix) chunks covering every row.
+        """
+        for start in range(0, self.rows, chunk_size):
+            stop = min(start + chunk_size, self.rows)
+            rng = np.random.default_rng([self.seed, start])
+            chunk = rng.standard_normal((stop - start, self.dimension)).astype(
+                np.float32
+            )
+            chunk /= np.linalg.norm(chunk, axis=1, keepdims=True)
+            yield start, chunk
+
+
+# PostgREST filter evaluation
+
+
+def _parse_filter(value):
+    op, _, operand = value.partition(".")
+    return op, operand
+
+
+def _parse_in_list(operand):
+    return [item.strip().strip('"') for item in operand.strip("()").split(",") if item]
+
+
+def _apply_numeric_filter(dataset, indices, column, op, operand):
+    values = (dataset.latitudes if column == "latitude" else dataset.longitudes)[
+        indices
+    ]
+    operand = float(operand)
+    masks = {
+        "eq": values == operand,
+        "neq": values != operand,
+        "gt": values > operand,
+        "gte": values >= operand,
+        "lt": values < operand,
+        "lte": values <= operand,
+    }
+    if op not in masks:
+        raise HTTPException(status_code=400, detail=f"Unsupported operator {op}")
+    return indices[masks[op]]
+
+
+def _description_is_null(dataset, indices):
+    is_null = ~dataset.described[indices]
+    for position, index in enumerate(indices):
+        if int(index) in dataset.description_overrides:
+            is_null[position] = dataset.description_overrides[int(index)] is None
+    return is_null
+
+
+def _apply_text_filter(dataset, indices, column, op, operand):
+    # Null checks on description are the hot path, so they avoid building rows
+    if column == "description" and operand == "null" and op in ("is", "neq"):
+        is_null = _description_is_null(dataset, indices)
+        return indices[is_null] if op == "is" else indices[~is_null]
+
+    def value(index):
+        if column == "description":
+            return dataset.description(index)
+        if column == "image_url":
+            return dataset.image_url(index)
+        return dataset.image_id(index)
+
+    if op == "is" and operand == "null":
+        keep = [i for i in indices if value(i) is None]
+    elif op == "eq":
+        keep = [i for i in indices if value(i) == operand]
+    elif op == "neq":
+        # NULL <> x is NULL in SQL, so null rows never match neq
+        keep = [i for i in indices if value(i) is not None and value(i) != operand]
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported operator {op}")
+    return np.asarray(keep, dtype=np.int64)
+
+
+def select_indices(dataset, params):
+    """
+    Evaluate PostgREST-style filters against the dataset, narrowing by the cheap
+    filters (id lookups, coordinates) before the per-row text filters.
+    """
+    indices = None
+    filters = [
+        (column, *_parse_filter(value))
+        for column, value in params.multi_items()
+        if column not in ("select", "limit", "offset", "order")
+    ]
+
+    for column, op, operand in filters:
+        if column == "image_id" and op in ("in", "eq"):
+            ids = _parse_in_list(operand) if op == "in" else [operand]
+            found = [dataset.index_of(image_id) for image_id in ids]
+            found = np.asarray([i for i in found if i is not None], dtype=np.int64)
+            indices = found if indices is None else np.intersect1d(indices, found)
+        elif column == "image_url" and op == "eq":
+            found = dataset.index_of_url(operand)
+            found = np.asarray([] if found is None else [found], dtype=np.int64)
+            indices = found if indices is None else np.intersect1d(indices, found)
+
+    if indices is None:
+        indices = np.arange(dataset.rows, dtype=np.int64)
+
+    for column, op, operand in filters:
+        if column in ("latitude", "longitude"):
+            indices = _apply_numeric_filter(dataset, indices, column, op, operand)
+
+    for column, op, operand in filters:
+        if column in ("image_id", "image_url") and op in ("in", "eq"):
+            continue
+        if column in ("description", "image_url", "image_id"):
+            indices = _apply_text_filter(dataset, indices, column, op, operand)
+
+    return indices
+
+
+def project(row, select):
+    if not select or select == "*":
+        return row
+    columns = [column.strip() for column in select.split(",")]
+    return {column: row[column] for column in columns if column in row}
+
+
+def create_app(dataset, profiles=None):
+    profiles = profiles or {}
+    cohere_profile = profiles.get("cohere", ServiceProfile())
+    gemini_profile = profiles.get("gemini", ServiceProfile())
+    postgrest_profile = profiles.get("postgrest", ServiceProfile())
+
+    app = FastAPI()
+    app.state.dataset = dataset
+    uploaded_files: Dict[str, dict] = {}
+
+    # Cohere
+
+    async def embed(request: Request, v2: bool):
+        await cohere_profile.simulate()
+        body = await request.json()
+        texts = body.get("texts", [])
+        embeddings = [
+            text_embedding(text, dataset.dimension).tolist() for text in texts
+        ]
+        response = {
+            "id": str(uuid.uuid4()),
+            "embeddings": {"float": embeddings},
+            "texts": texts,
+            "meta": {
+                "api_version": {"version": "2" if v2 else "1"},
+                "billed_units": {
+                    "input_tokens": sum(len(text.split()) for text in texts)
+                },
+            },
+        }
+        if not v2:
+            response["response_type"] = "embeddings_by_type"
+        return response
+
+    @app.post("/v1/embed")
+    async def cohere_embed_v1(request: Request):
+        return await embed(request, v2=False)
+
+    @app.post("/v2/embed")
+    async def cohere_embed_v2(request: Request):
+        return await embed(request, v2=True)
+
+    # Gemini
+
+    def file_resource(name):
+        return {
+            "name": name,
+            "displayName": name.split("/")[-1],
+            "mimeType": "image/jpeg",
+            "sizeBytes": "65536",
+            "uri": f"https://generativelanguage.fake.local/v1beta/{name}",
+            "state": "ACTIVE",
+        }
+
+    @app.post("/upload/v1beta/files")
+    async def gemini_upload_file(request: Request):
+        await gemini_profile.simulate()
+        await request.body()
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        uploaded_files[name] = file_resource(name)
+        return {"file": uploaded_files[name]}
+
+    @app.get("/v1beta/files/{file_id}")
+    async def gemini_get_file(file_id: str):
+        await gemini_profile.simulate()
+        name = f"files/{file_id}"
+        # Any file name resolves so benchmarks can skip the upload step
+        return uploaded_files.get(name) or file_resource(name)
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def gemini_generate_content(model: str, request: Request):
+        await gemini_profile.simulate()
+        body = await request.json()
+        parts = [
+            part for content in body.get("contents", []) for part in content["parts"]
+        ]
+        images = [part for part in parts if "fileData" in part or "inlineData" in part]
+        prompt_text = " ".join(part.get("text", "") for part in parts)
+        generation_config = body.get("generationConfig", {})
+
+        def caption_for(key):
+            seed = int(hashlib.sha256(key.encode()).hexdigest()[:8], 16)
+            return synthetic_description(seed % 1_000_003, words=80)
+
+        if generation_config.get("responseMimeType") == "application/json":
+            # Batched captioning: one caption per "Image ID: ..." marker
+            image_ids = re.findall(r"Image ID: (\S+)", prompt_text)
+            captions = [
+                {"id": image_id, "caption": caption_for(image_id)}
+                for image_id in image_ids
+            ]
+            text = json.dumps(captions)
+            output_words = sum(len(item["caption"].split()) for item in captions)
+        else:
+            text = caption_for(json.dumps(images))
+            output_words = len(text.split())
+
+        prompt_tokens = GEMINI_TOKENS_PER_IMAGE * len(images) + len(prompt_text.split())
+        output_tokens = int(output_words * 1.3)
+        return {
+            "candidates": [
+                {
+                    "content": {"parts": [{"text": text}], "role": "model"},
+                    "finishReason": "STOP",
+                    "index": 0,
+                }
+            ],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": prompt_tokens + output_tokens,
+            },
+        }
+
+    # Supabase PostgREST
+
+    def check_table(table):
+        if table != "street_view_images":
+            raise HTTPException(status_code=404, detail=f"Unknown table {table}")
+
+    @app.get("/rest/v1/{table}")
+    async def postgrest_select(table: str, request: Request):
+        await postgrest_profile.simulate()
+        check_table(table)
+        params = request.query_params
+        indices = select_indices(dataset, params)
+
+        offset = int(params.get("offset", 0))
+        limit = min(int(params.get("limit", POSTGREST_MAX_ROWS)), POSTGREST_MAX_ROWS)
+        indices = indices[offset : offset + limit]
+        return [project(dataset.row(int(i)), params.get("select")) for i in indices]
+
+    @app.patch("/rest/v1/{table}")
+    async def postgrest_update(table: str, request: Request):
+        await postgrest_profile.simulate()
+        check_table(table)
+        body = await request.json()
+        indices = select_indices(dataset, request.query_params)
+        for index in indices:
+            if "description" in body:
+                dataset.description_overrides[int(index)] = body["description"]
+        return [dataset.row(int(i)) for i in indices]
+
+    return app
+
+
+def parse_service_values(values, cast=float):
+    """
+    Parse repeated "service=value" CLI arguments into a dict.
+    """
+    parsed = {}
+    for value in values or []:
+        service, _, amount = value.partition("=")
+        parsed[service] = cast(amount)
+    return parsed
+
+
+def build_profiles(latencies, jitters, error_rates):
+    services = set(latencies) | set(jitters) | set(error_rates)
+    return {
+        service: ServiceProfile(
+            latency_ms=latencies.get(service, 0.0),
+            jitter_ms=jitters.get(service, 0.0),
+            error_rate=error_rates.get(service, 0.0),
+        )
+        for service in services
+    }
+
+
+def add_service_arguments(parser):
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--dimension", type=int, default=EMBEDDING_DIMENSION)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--latency",
+        action="append",
+        metavar="SERVICE=MS",
+        help="Base latency per service (cohere, gemini, postgrest)",
+    )
+    parser.add_argument("--jitter", action="append", metavar="SERVICE=MS")
+    parser.add_argument("--error-rate", action="append", metavar="SERVICE=RATE")
+
+
+def profiles_from_args(args):
+    return build_profiles(
+        parse_service_values(args.latency),
+        parse_service_values(args.jitter),
+        parse_service_values(args.error_rate),
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    add_service_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    dataset = SyntheticDataset(rows=args.rows, dimension=args.dimension, seed=args.seed)
+    print(
+        f"Generated {dataset.rows} synthetic rows in {time.time() - start_time:.2f} seconds."
+    )
+
+    uvicorn.run(
+        create_app(dataset, profiles_from_args(args)), host=args.host, port=args.port
+    )
@@ -0,0 +1,24 @@
+import asyncio
+import google.generativeai as genai
+from config import settings
+
+
+# Configure Google Generative AI, optionally against a custom endpoint
+def configure_gemini():
+    if settings.GEMINI_API_ENDPOINT:
+        # Custom endpoints (e.g. the local stand-in in fake_services.py) speak REST
+        genai.configure(
+            api_key=settings.GEMINI_API_KEY,
+            transport="rest",
+            client_options={"api_endpoint": settings.GEMINI_API_ENDPOINT},
+        )
+    else:
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+
+
+async def generate_content(model, contents):
+    # The SDK's async client has no working REST transport, so custom endpoints
+    # run the blocking call in a worker thread instead
+    if settings.GEMINI_API_ENDPOINT:
+        return await asyncio.to_thread(model.generate_content, contents)
+    return await model.generate_content_async(contents)
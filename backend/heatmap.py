@@ -0,0 +1,164 @@
+import threading
+
+import numpy as np
+from cachetools import LRUCache
+from sqlalchemy import select, text
+from supabase_settings import supabase_client
+
+MIN_ZOOM = 10
+MAX_ZOOM = 18
+# Each web-mercator map tile is split into CELLS_PER_TILE x CELLS_PER_TILE cells
+CELLS_PER_TILE = 16
+# image_ids per Supabase lookup, to keep the in.(...) filter within URL limits
+HYDRATE_BATCH_SIZE = 200
+MERCATOR_MAX_LATITUDE = 85.05112878
+
+# Image coordinates never change, so lookups are kept for the process lifetime.
+# Grids are built in worker threads, and LRUCache isn't thread-safe.
+coordinate_cache = LRUCache(maxsize=200_000)
+coordinate_lock = threading.Lock()
+
+
+def mercator_xy(latitudes, longitudes):
+    """
+    Fractional web-mercator world coordinates in [0, 1), y growing southwards.
+    """
+    latitudes = np.clip(
+        np.asarray(latitudes, dtype=np.float64),
+        -MERCATOR_MAX_LATITUDE,
+        MERCATOR_MAX_LATITUDE,
+    )
+    x = (np.asarray(longitudes, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.arcsinh(np.tan(np.radians(latitudes))) / np.pi) / 2.0
+    return x, y
+
+
+def cell_centers(ix, iy, cells):
+    longitudes = (ix + 0.5) / cells * 360.0 - 180.0
+    latitudes = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (iy + 0.5) / cells))))
+    return latitudes, longitudes
+
+
+class HeatmapGrid:
+    """
+    Similarity scores summed into grid cells, binned up front for every zoom level
+    so that panning and zooming only has to slice out the visible cells.
+    """
+
+    def __init__(self, latitudes, longitudes, scores):
+        x, y = mercator_xy(latitudes, longitudes)
+        scores = np.asarray(scores, dtype=np.float64)
+        self.candidates = len(scores)
+        self.levels = {
+            zoom: self._bin(x, y, scores, CELLS_PER_TILE << zoom)
+            for zoom in range(MIN_ZOOM, MAX_ZOOM + 1)
+        }
+
+    @staticmethod
+    def _bin(x, y, scores, cells):
+        ix = np.minimum((x * cells).astype(np.int64), cells - 1)
+        iy = np.minimum((y * cells).astype(np.int64), cells - 1)
+        keys, inverse = np.unique(iy * cells + ix, return_inverse=True)
+        return {
+            "ix": keys % cells,
+            "iy": keys // cells,
+            "weights": np.bincount(inverse, weights=scores),
+            "counts": np.bincount(inverse),
+        }
+
+    def cells(self, zoom, south, west, north, east):
+        """
+        Non-empty cells overlapping the viewport as (lat, lon, weight) rows at the
+        cell centers, plus the number of candidates in each cell.
+        """
+        level = self.levels[zoom]
+        cells = CELLS_PER_TILE << zoom
+        # The north-west corner has the smallest mercator x and y
+        x_min, y_min = (int(value * cells) for value in mercator_xy(north, west))
+        x_max, y_max = (int(value * cells) for value in mercator_xy(south, east))
+        visible = (
+            (level["ix"] >= x_min)
+            & (level["ix"] <= x_max)
+            & (level["iy"] >= y_min)
+            & (level["iy"] <= y_max)
+        )
+
+        latitudes, longitudes = cell_centers(
+            level["ix"][visible], level["iy"][visible], cells
+        )
+        points = np.column_stack([latitudes, longitudes, level["weights"][visible]])
+        return points, level["counts"][visible]
+
+
+def score_candidates(vx, docs, embedding, limit, min_score):
+    """
+    Exact cosine scan for up to `limit` vectors with similarity >= min_score,
+    returned as (id, similarity, metadata) best first. Index scans are disabled,
+    since `limit` may exceed what HNSW returns (see partitions.query_collections).
+    """
+    distance = docs.table.c.vec.cosine_distance(embedding)
+    stmt = (
+        select(docs.table.c.id, distance, docs.table.c.metadata)
+        .where(distance <= 1 - min_score)
+        .order_by(distance)
+        .limit(limit)
+    )
+    with vx.Session() as sess:
+        with sess.begin():
+            sess.execute(text("SET LOCAL enable_indexscan = off"))
+            rows = sess.execute(stmt).all()
+    return [(row[0], 1 - row[1], row[2] or {}) for row in rows]
+
+
+def lookup_coordinates(image_ids):
+    """
+    {image_id: (latitude, longitude)} from Supabase, for ids not already cached.
+    """
+    coordinates = {}
+    with coordinate_lock:
+        for image_id in image_ids:
+            if image_id in coordinate_cache:
+                coordinates[image_id] = coordinate_cache[image_id]
+    missing = [image_id for image_id in image_ids if image_id not in coordinates]
+
+    for i in range(0, len(missing), HYDRATE_BATCH_SIZE):
+        response = (
+            supabase_client.table("street_view_images")
+            .select("image_id,latitude,longitude")
+            .in_("image_id", missing[i : i + HYDRATE_BATCH_SIZE])
+            .execute()
+        )
+        fetched = {
+            str(row["image_id"]): (row["latitude"], row["longitude"])
+            for row in response.data
+        }
+        with coordinate_lock:
+            coordinate_cache.update(fetched)
+        coordinates.update(fetched)
+    return coordinates
+
+
+def candidate_coordinates(candidates):
+    """
+    Latitudes, longitudes and scores for the candidates, taking coordinates from
+    the vector metadata where embeddings.py stored them and from Supabase otherwise.
+    """
+    coordinates = {}
+    for image_id, _, metadata in candidates:
+        if "latitude" in metadata and "longitude" in metadata:
+            coordinates[image_id] = (metadata["latitude"], metadata["longitude"])
+    coordinates.update(
+        lookup_coordinates(
+            [image_id for image_id, _, _ in candidates if image_id not in coordinates]
+        )
+    )
+
+    located = [
+        (*coordinates[image_id], score)
+        for image_id, score, _ in candidates
+        if image_id in coordinates
+    ]
+    if not located:
+        return np.empty(0), np.empty(0), np.empty(0)
+    latitudes, longitudes, scores = np.array(located, dtype=np.float64).T
+    return latitudes, longitudes, scores
@@ -1,7 +1,7 @@
 import asyncio
 import aiohttp
 import google.generativeai as genai
-from config import settings
+from gemini_settings import configure_gemini
 import sys
 import os
 import json
@@ -10,7 +10,7 @@ import io
 from tenacity import retry, stop_after_attempt, wait_fixed, RetryError
 
 # Configure Google Generative AI with the API key
-genai.configure(api_key=settings.GEMINI_API_KEY)
+configure_gemini()
 
 
 async def download_image(session, image_url):
@@ -1,15 +1,59 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Tuple
+from typing import List, Literal, Optional, Tuple
 from pydantic import BaseModel, Field
 from config import settings
 from supabase_settings import supabase_client
-import cohere
+from responses import encode_heatmap, json_response, search_columns
+from heatmap import (
+    MAX_ZOOM,
+    MIN_ZOOM,
+    HeatmapGrid,
+    candidate_coordinates,
+    score_candidates,
+)
+from pagination import (
+    MAX_PAGE_SIZE,
+    SEARCH_CANDIDATES,
+    candidate_cache,
+    decode_cursor,
+    encode_cursor,
+    store_candidates,
+)
+from embedding_providers import get_embedding_provider
+from partitions import (
+    BoundingBox,
+    bbox_filter,
+    collection_ids,
+    fan_out,
+    open_collections,
+    query_collections,
+    tile_range,
+)
+from cachetools import TTLCache
+import heapq
+import itertools
 import vecs
-from sqlalchemy import select
 
 app = FastAPI()
-co = cohere.Client(api_key=settings.COHERE_API_KEY)
+embedding_provider = get_embedding_provider()
+fallback_provider = (
+    get_embedding_provider(settings.EMBEDDING_FALLBACK_PROVIDER)
+    if settings.EMBEDDING_FALLBACK_PROVIDER
+    else None
+)
+
+# Downtown bounding box, the default area of the listing endpoints and the heatmap
+LONGITUDE_MIN = -79.403619  # topleft longitude
+LONGITUDE_MAX = -79.374303  # bottomright longitude
+LATITUDE_MIN = 43.637794  # bottomleft latitude
+LATITUDE_MAX = 43.670535  # topright latitude
+
+MAX_HEATMAP_CANDIDATES = 20000
+# Heatmap grids per (query, min_score, candidates, partition tiles), reused while
+# the map pans and zooms. Only read and written on the event loop, so no lock.
+heatmap_grid_cache = TTLCache(maxsize=64, ttl=600)
 
 # Configure CORS
 app.add_middleware(
@@ -25,6 +69,43 @@ class SearchQuery(BaseModel):
     q: str = Field(..., min_length=1, max_length=100, description="The search phrase")
 
 
+def bounding_box(
+    south: float = Query(LATITUDE_MIN, ge=-90, le=90),
+    west: float = Query(LONGITUDE_MIN, ge=-180, le=180),
+    north: float = Query(LATITUDE_MAX, ge=-90, le=90),
+    east: float = Query(LONGITUDE_MAX, ge=-180, le=180),
+):
+    if south > north or west > east:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    return BoundingBox(south, west, north, east)
+
+
+def search_area(
+    south: Optional[float] = Query(None, ge=-90, le=90),
+    west: Optional[float] = Query(None, ge=-180, le=180),
+    north: Optional[float] = Query(None, ge=-90, le=90),
+    east: Optional[float] = Query(None, ge=-180, le=180),
+):
+    """
+    Optional bounding box for /search; without one the whole index is searched.
+    Only supported with VECTOR_PARTITIONING (see partitions.query_collections).
+    """
+    corners = (south, west, north, east)
+    if all(corner is None for corner in corners):
+        return None
+    if any(corner is None for corner in corners):
+        raise HTTPException(
+            status_code=400,
+            detail="south, west, north and east must be given together",
+        )
+    if not settings.VECTOR_PARTITIONING:
+        raise HTTPException(
+            status_code=400,
+            detail="Searching within a bounding box needs VECTOR_PARTITIONING",
+        )
+    return bounding_box(*corners)
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the search API"}
@@ -42,21 +123,15 @@ async def test():
 
 
 @app.get("/street_view_images")
-async def get_street_view_images():
-    # Updated longitude and latitude values
-    longitude_min = -79.403619  # topleft longitude
-    longitude_max = -79.374303  # bottomright longitude
-    latitude_min = 43.637794  # bottomleft latitude
-    latitude_max = 43.670535  # topright latitude
-
+async def get_street_view_images(bbox: BoundingBox = Depends(bounding_box)):
     try:
         response = (
             supabase_client.table("street_view_images")
             .select("*")
-            .filter("longitude", "gte", longitude_min)
-            .filter("longitude", "lte", longitude_max)
-            .filter("latitude", "gte", latitude_min)
-            .filter("latitude", "lte", latitude_max)
+            .filter("longitude", "gte", bbox.west)
+            .filter("longitude", "lte", bbox.east)
+            .filter("latitude", "gte", bbox.south)
+            .filter("latitude", "lte", bbox.north)
             .execute()
         )
 
@@ -66,21 +141,17 @@ async def get_street_view_images():
 
 
 @app.get("/street_view_images_without_description")
-async def get_street_view_images_without_description():
-    # Updated longitude and latitude values
-    longitude_min = -79.403619  # topleft longitude
-    longitude_max = -79.374303  # bottomright longitude
-    latitude_min = 43.637794  # bottomleft latitude
-    latitude_max = 43.670535  # topright latitude
-
+async def get_street_view_images_without_description(
+    bbox: BoundingBox = Depends(bounding_box),
+):
     try:
         response = (
             supabase_client.table("street_view_images")
             .select("*")
-            .filter("longitude", "gte", longitude_min)
-            .filter("longitude", "lte", longitude_max)
-            .filter("latitude", "gte", latitude_min)
-            .filter("latitude", "lte", latitude_max)
+            .filter("longitude", "gte", bbox.west)
+            .filter("longitude", "lte", bbox.east)
+            .filter("latitude", "gte", bbox.south)
+            .filter("latitude", "lte", bbox.north)
             .filter("description", "is", "null")
             .execute()
         )
@@ -91,21 +162,17 @@ async def get_street_view_images_without_description():
 
 
 @app.get("/street_view_images_with_description")
-async def get_street_view_images_with_description():
-    # Updated longitude and latitude values
-    longitude_min = -79.403619  # topleft longitude
-    longitude_max = -79.374303  # bottomright longitude
-    latitude_min = 43.637794  # bottomleft latitude
-    latitude_max = 43.670535  # topright latitude
-
+async def get_street_view_images_with_description(
+    bbox: BoundingBox = Depends(bounding_box),
+):
     try:
         response = (
             supabase_client.table("street_view_images")
             .select("*")
-            .filter("longitude", "gte", longitude_min)
-            .filter("longitude", "lte", longitude_max)
-            .filter("latitude", "gte", latitude_min)
-            .filter("latitude", "lte", latitude_max)
+            .filter("longitude", "gte", bbox.west)
+            .filter("longitude", "lte", bbox.east)
+            .filter("latitude", "gte", bbox.south)
+            .filter("latitude", "lte", bbox.north)
             .filter("description", "neq", "null")
             .execute()
         )
@@ -119,76 +186,67 @@ async def get_street_view_images_with_description():
     except Exception as e:
         print(f"Error in get_street_view_images_with_description: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-    
-
 
 
 @app.get("/street_view_images_without_embeddings")
-async def get_street_view_images_without_embeddings():
-    # Updated longitude and latitude values
-    longitude_min = -79.403619  # topleft longitude
-    longitude_max = -79.374303  # bottomright longitude
-    latitude_min = 43.637794    # bottomleft latitude
-    latitude_max = 43.670535    # topright latitude
-
+async def get_street_view_images_without_embeddings(
+    bbox: BoundingBox = Depends(bounding_box),
+):
     try:
         # First, get all image_ids that already have embeddings
         with vecs.create_client(settings.DB_CONNECTION_STRING) as vx:
-            docs = vx.get_or_create_collection(name="image_embeddings", dimension=1024)
-            existing_embeddings = set()
-            
-            # Fetch all IDs using SQL
-            with vx.Session() as sess:
-                stmt = select(docs.table.c.id)
-                result = sess.execute(stmt)
-                existing_embeddings = set(row[0] for row in result)
-        
+            collections = open_collections(
+                vx,
+                embedding_provider.collection_name,
+                embedding_provider.dimension,
+                bbox,
+            )
+            # Fetch all IDs using SQL, from every partition overlapping the area
+            existing_embeddings = collection_ids(collections)
+
         print(f"Number of existing embeddings: {len(existing_embeddings)}")
 
         # Now, query Supabase for images with descriptions that don't have embeddings
-        response = supabase_client.table("street_view_images").select("*").filter(
-            "longitude", "gte", longitude_min
-        ).filter("longitude", "lte", longitude_max).filter(
-            "latitude", "gte", latitude_min
-        ).filter("latitude", "lte", latitude_max).filter(
-            "description", "neq", "null"
-        ).execute()
+        response = (
+            supabase_client.table("street_view_images")
+            .select("*")
+            .filter("longitude", "gte", bbox.west)
+            .filter("longitude", "lte", bbox.east)
+            .filter("latitude", "gte", bbox.south)
+            .filter("latitude", "lte", bbox.north)
+            .filter("description", "neq", "null")
+            .execute()
+        )
 
         print(f"Number of images without embeddings: {len(response.data)}")
-        
+
         if response.data is None:
             raise Exception("No data returned from Supabase")
-        
+
         # Filter out images that already have embeddings
         filtered_data = [
-            row for row in response.data 
-            if str(row['image_id']) not in existing_embeddings
+            row
+            for row in response.data
+            if str(row["image_id"]) not in existing_embeddings
         ]
-        
+
         return filtered_data
 
     except Exception as e:
         print(f"Error in get_street_view_images_without_embeddings: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-    
 
 
 @app.get("/street_view_images_hundred")
-async def get_street_view_images_hundred():
-    # Updated longitude and latitude values
-    longitude_min = -79.403619  # topleft longitude
-    longitude_max = -79.374303  # bottomright longitude
-    latitude_min = 43.637794  # bottomleft latitude
-    latitude_max = 43.670535  # topright latitude
-
+async def get_street_view_images_hundred(bbox: BoundingBox = Depends(bounding_box)):
     try:
         response = (
             supabase_client.table("street_view_images")
             .select("*")
-            .filter("longitude", "gte", longitude_min)
-            .filter("longitude", "lte", longitude_max)
-            .filter("latitude", "gte", latitude_min)
-            .filter("latitude", "lte", latitude_max)
+            .filter("longitude", "gte", bbox.west)
+            .filter("longitude", "lte", bbox.east)
+            .filter("latitude", "gte", bbox.south)
+            .filter("latitude", "lte", bbox.north)
             .limit(100)
             .execute()
         )
@@ -198,47 +256,184 @@ async def get_street_view_images_hundred():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/search")
-async def search(q: str = Query(..., min_length=1, max_length=100)):
+def query_collection(provider, q, bbox=None):
     with vecs.create_client(settings.DB_CONNECTION_STRING) as vx:
+        embedding = provider.embed_queries([q])[0]
 
-        res = co.embed(
-            texts=[q],
-            model="embed-english-v3.0",
-            input_type="search_query",
-            embedding_types=["float"],
+        collections = open_collections(
+            vx, provider.collection_name, provider.dimension, bbox
         )
-        embedding = res.embeddings.float[0]
-
-        docs = vx.get_or_create_collection(name="image_embeddings", dimension=1024)
-        results_from_query = docs.query(
-            data=embedding,
-            limit=100,
-            measure="cosine_distance",
-            include_value=True, 
+        results_from_query = query_collections(
+            collections, embedding, SEARCH_CANDIDATES, bbox_filter(bbox)
         )
         # results_from_query is a list of tuples, where each tuple[0] contains the result ID and each tuple[1] contains the cosine similarity
-        print(results_from_query)
         result_ids = [result[0] for result in results_from_query]
         similarity_scores = [1 - result[1] for result in results_from_query]  # Convert distance to similarity
 
+    return result_ids, similarity_scores
+
+
+def search_candidates(q, bbox=None):
+    try:
+        return query_collection(embedding_provider, q, bbox)
+    except Exception as e:
+        if fallback_provider is None:
+            raise
+        print(
+            f"Search with {embedding_provider.name} embeddings failed, "
+            f"falling back to {fallback_provider.name}: {e}"
+        )
+        return query_collection(fallback_provider, q, bbox)
+
+
+def fetch_rows(select_columns, result_ids):
     results = (
         supabase_client.table("street_view_images")
-        .select("*")
+        .select(select_columns)
         .in_("image_id", result_ids)
         .execute()
     )
+    return results.data
+
+
+@app.get("/search")
+async def search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated columns to return, 'lean', or '*' (default)",
+    ),
+    heatmap_format: Literal["json", "f32"] = Query(
+        "json",
+        description="'f32' returns the heatmap as base64 packed float32 lat/lon/score",
+    ),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(
+        None, description="next_cursor from the previous page of this search"
+    ),
+    bbox: Optional[BoundingBox] = Depends(search_area),
+):
+    """
+    Images ranked by similarity to `q`, a page at a time. south/west/north/east
+    restrict the search to an area and need VECTOR_PARTITIONING; without it they
+    are rejected with a 400.
+    """
+    select_columns = search_columns(fields)
+
+    # Later pages are sliced from the candidates ranked by the first page
+    offset = 0
+    candidates = None
+    if cursor:
+        token, offset, cursor_q, cursor_bbox = decode_cursor(cursor)
+        if (cursor_q, cursor_bbox) != (q, bbox):
+            raise HTTPException(status_code=400, detail="Cursor is for another query")
+        candidates = candidate_cache.get(token)
+    if candidates is None:
+        # Embedding and vector search block, so keep them off the event loop
+        candidates = await run_in_threadpool(search_candidates, q, bbox)
+        token = store_candidates(*candidates)
+
+    result_ids = candidates[0][offset : offset + limit]
+    similarity_scores = candidates[1][offset : offset + limit]
+    next_offset = offset + limit
+    next_cursor = (
+        encode_cursor(token, next_offset, q, bbox)
+        if next_offset < len(candidates[0])
+        else None
+    )
+
+    rows = await run_in_threadpool(fetch_rows, select_columns, result_ids)
+    # Rows come back in table order, so put them back in similarity order
+    rows_by_id = {str(row["image_id"]): row for row in rows}
+
+    ranked_rows = []
     # Prepare heatmap data
     heatmap_data: List[Tuple[float, float, float]] = []
-    for result, score in zip(results.data, similarity_scores):
+    for result_id, score in zip(result_ids, similarity_scores):
+        row = rows_by_id.get(result_id)
+        if row is None:
+            continue
+        ranked_rows.append(row)
         heatmap_data.append((
-            result['latitude'],
-            result['longitude'],
+            row['latitude'],
+            row['longitude'],
             score  # Use similarity score as weight
         ))
 
-    return {"results": results.data,
-            "heatmap_data": heatmap_data}
+    return json_response(
+        request,
+        {
+            "results": ranked_rows,
+            "heatmap_data": encode_heatmap(heatmap_data, heatmap_format),
+            "next_cursor": next_cursor,
+        },
+    )
+
+
+def build_heatmap_grid(q, min_score, candidates, viewport):
+    with vecs.create_client(settings.DB_CONNECTION_STRING) as vx:
+        embedding = embedding_provider.embed_queries([q])[0]
+        collections = open_collections(
+            vx,
+            embedding_provider.collection_name,
+            embedding_provider.dimension,
+            viewport,
+        )
+        scored = fan_out(
+            lambda docs: score_candidates(vx, docs, embedding, candidates, min_score),
+            collections,
+        )
+        scored = heapq.nlargest(
+            candidates,
+            itertools.chain.from_iterable(scored),
+            key=lambda candidate: candidate[1],
+        )
+    return HeatmapGrid(*candidate_coordinates(scored))
+
+
+@app.get("/heatmap_tiles")
+async def heatmap_tiles(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    zoom: int = Query(14, ge=MIN_ZOOM, le=MAX_ZOOM),
+    viewport: BoundingBox = Depends(bounding_box),
+    min_score: float = Query(0.25, ge=0, le=1),
+    candidates: int = Query(5000, ge=1, le=MAX_HEATMAP_CANDIDATES),
+    heatmap_format: Literal["json", "f32"] = "json",
+):
+    """
+    Heatmap for a query: scores up to `candidates` images above `min_score` in
+    the partitions overlapping the viewport, and returns their summed scores per
+    grid cell for the viewport. The grid covers whole partitions, so it is
+    reused while the viewport stays within the same tiles.
+    """
+    tiles = tile_range(viewport) if settings.VECTOR_PARTITIONING else None
+    cache_key = (q, min_score, candidates, tiles)
+    grid = heatmap_grid_cache.get(cache_key)
+    if grid is None:
+        try:
+            # Embedding, the exact scan and binning block, so keep them off the loop
+            grid = await run_in_threadpool(
+                build_heatmap_grid, q, min_score, candidates, viewport
+            )
+        except Exception as e:
+            print(f"Error in heatmap_tiles: {str(e)}")
+            raise HTTPException(
+                status_code=500, detail=f"Internal server error: {str(e)}"
+            )
+        heatmap_grid_cache[cache_key] = grid
+
+    points, counts = grid.cells(zoom, *viewport)
+    return json_response(
+        request,
+        {
+            "zoom": zoom,
+            "candidates": grid.candidates,
+            "heatmap_data": encode_heatmap(points, heatmap_format),
+            "counts": counts,
+        },
+    )
 
 
 if __name__ == "__main__":
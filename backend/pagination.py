@@ -0,0 +1,45 @@
+import base64
+import binascii
+import json
+import uuid
+
+from cachetools import TTLCache
+from fastapi import HTTPException
+from partitions import BoundingBox
+
+# Ranked candidates fetched by the first page of a search; vecs caps queries at 1000
+SEARCH_CANDIDATES = 1000
+MAX_PAGE_SIZE = 200
+
+# Ranked (ids, similarity scores) per search, served to later pages until they expire
+candidate_cache = TTLCache(maxsize=256, ttl=300)
+
+
+def store_candidates(result_ids, similarity_scores):
+    token = uuid.uuid4().hex
+    candidate_cache[token] = (result_ids, similarity_scores)
+    return token
+
+
+def encode_cursor(token, offset, q, bbox=None):
+    payload = json.dumps({"t": token, "o": offset, "q": q, "b": bbox}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    (token, offset, q, bbox) from a cursor. The query and search area travel with
+    the cursor so an expired or unknown token can be recomputed rather than
+    failing the page.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        token, offset, q = payload["t"], int(payload["o"]), payload["q"]
+        bbox = payload.get("b")
+        if bbox is not None:
+            bbox = BoundingBox(*map(float, bbox))
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(token, str) or not isinstance(q, str) or offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return token, offset, q, bbox
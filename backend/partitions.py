@@ -0,0 +1,308 @@
+"""
+Geographic partitioning of the vector collections. With VECTOR_PARTITIONING
+on, each provider's vectors are split into one collection per fixed-size
+lat/lon tile, named <collection>__p<x>_<y>, each with its own HNSW index.
+Queries are routed to the partitions overlapping the requested area, run in
+parallel and merged into one top-k list.
+
+Maintenance:
+    python partitions.py list
+    python partitions.py split            # move an existing collection into partitions
+    python partitions.py index all        # or index <partition> ...
+"""
+
+import argparse
+import heapq
+import itertools
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import vecs
+from config import settings
+from sqlalchemy import select
+
+# Partitions queried at once; each query holds one database connection
+QUERY_WORKERS = 8
+# Rows per keyset page when splitting an existing collection
+SPLIT_BATCH_SIZE = 1000
+
+PARTITION_PATTERN = re.compile(r"^(?P<base>.+)__p(?P<x>\d+)_(?P<y>\d+)$")
+
+executor = ThreadPoolExecutor(
+    max_workers=QUERY_WORKERS, thread_name_prefix="partition-query"
+)
+
+
+class BoundingBox(NamedTuple):
+    south: float
+    west: float
+    north: float
+    east: float
+
+
+def parse_bbox(value):
+    """
+    argparse type for a "south,west,north,east" bounding box.
+    """
+    try:
+        bbox = BoundingBox(*(float(corner) for corner in value.split(",")))
+    except (TypeError, ValueError):
+        raise argparse.ArgumentTypeError("expected south,west,north,east")
+    if not (
+        -90 <= bbox.south <= bbox.north <= 90 and -180 <= bbox.west <= bbox.east <= 180
+    ):
+        raise argparse.ArgumentTypeError("not a valid south,west,north,east box")
+    return bbox
+
+
+def tile_for(latitude, longitude, degrees=None):
+    """
+    (x, y) index of the tile containing a point, counted from (-180, -90).
+    """
+    degrees = degrees or settings.PARTITION_TILE_DEGREES
+    return (
+        math.floor((longitude + 180) / degrees),
+        math.floor((latitude + 90) / degrees),
+    )
+
+
+def tile_bounds(tile, degrees=None):
+    degrees = degrees or settings.PARTITION_TILE_DEGREES
+    x, y = tile
+    return BoundingBox(
+        south=y * degrees - 90,
+        west=x * degrees - 180,
+        north=(y + 1) * degrees - 90,
+        east=(x + 1) * degrees - 180,
+    )
+
+
+def tile_range(bbox, degrees=None):
+    """
+    (x_min, y_min, x_max, y_max) of the tiles a bbox touches.
+    """
+    x_min, y_min = tile_for(bbox.south, bbox.west, degrees)
+    x_max, y_max = tile_for(bbox.north, bbox.east, degrees)
+    return x_min, y_min, x_max, y_max
+
+
+def overlaps(tile, bbox, degrees=None):
+    x_min, y_min, x_max, y_max = tile_range(bbox, degrees)
+    return x_min <= tile[0] <= x_max and y_min <= tile[1] <= y_max
+
+
+def partition_name(base, tile):
+    return f"{base}__p{tile[0]}_{tile[1]}"
+
+
+def parse_partition_name(name):
+    """
+    (base collection, tile) for a partition name, or None for any other name.
+    """
+    match = PARTITION_PATTERN.match(name)
+    if match is None:
+        return None
+    return match["base"], (int(match["x"]), int(match["y"]))
+
+
+def open_collections(vx, base, dimension, bbox=None):
+    """
+    The collections a query over `bbox` (None for everywhere) has to search:
+    the base collection, or with partitioning on, the partitions overlapping it.
+    """
+    if not settings.VECTOR_PARTITIONING:
+        return [vx.get_or_create_collection(name=base, dimension=dimension)]
+
+    # One catalog query; Collection objects from it need no further round trips
+    partitions = {}
+    for collection in vx.list_collections():
+        parsed = parse_partition_name(collection.name)
+        if parsed is not None and parsed[0] == base:
+            partitions[parsed[1]] = collection
+    # Checked per existing partition, so the cost doesn't grow with the bbox
+    return [
+        partitions[tile]
+        for tile in sorted(partitions)
+        if bbox is None or overlaps(tile, bbox)
+    ]
+
+
+def bbox_filter(bbox):
+    """
+    vecs metadata filter keeping vectors whose stored coordinates are in `bbox`.
+    Partitions always store coordinates, since vectors without them are never
+    written to one.
+    """
+    if bbox is None:
+        return None
+    return {
+        "$and": [
+            {"latitude": {"$gte": bbox.south}},
+            {"latitude": {"$lte": bbox.north}},
+            {"longitude": {"$gte": bbox.west}},
+            {"longitude": {"$lte": bbox.east}},
+        ]
+    }
+
+
+def fan_out(function, collections):
+    """
+    function(collection) for every collection, in parallel when there are several.
+    """
+    if len(collections) == 1:
+        return [function(collections[0])]
+    return list(executor.map(function, collections))
+
+
+def query_collections(collections, embedding, limit, filters=None):
+    """
+    Nearest `limit` vectors across the collections as (id, cosine distance),
+    closest first. Each partition returns its own top `limit`, so the merge is exact.
+
+    HNSW returns at most ef_search rows, so it is raised to `limit`. Metadata
+    filters are applied to those rows after the index scan: that is why an area
+    is only searched with partitioning on, where routing keeps the scanned
+    partitions close to the area, and why a very small area in a dense partition
+    can still return fewer than the available matches.
+    """
+
+    def query(docs):
+        return docs.query(
+            data=embedding,
+            limit=limit,
+            filters=filters,
+            measure="cosine_distance",
+            include_value=True,
+            ef_search=limit,
+        )
+
+    results = fan_out(query, collections)
+    return heapq.nsmallest(
+        limit, itertools.chain.from_iterable(results), key=lambda result: result[1]
+    )
+
+
+def collection_ids(collections):
+    def ids(docs):
+        with docs.client.Session() as sess:
+            return [row[0] for row in sess.execute(select(docs.table.c.id))]
+
+    return set(itertools.chain.from_iterable(fan_out(ids, collections)))
+
+
+def create_indexes(collections):
+    for docs in collections:
+        print(f"Building HNSW index on {docs.name}...")
+        docs.create_index(
+            method=vecs.IndexMethod.hnsw,
+            measure=vecs.IndexMeasure.cosine_distance,
+        )
+
+
+def split_collection(vx, base, dimension):
+    """
+    Copy every vector of the unpartitioned `base` collection into its tile's
+    partition, using stored coordinates or Supabase for vectors without them.
+    Vectors without known coordinates are reported and left out.
+    """
+    from heatmap import lookup_coordinates
+
+    docs = vx.get_or_create_collection(name=base, dimension=dimension)
+    partitions = {}
+    copied = skipped = 0
+    last_id = ""
+    while True:
+        with vx.Session() as sess:
+            rows = sess.execute(
+                select(docs.table.c.id, docs.table.c.vec, docs.table.c.metadata)
+                .where(docs.table.c.id > last_id)
+                .order_by(docs.table.c.id)
+                .limit(SPLIT_BATCH_SIZE)
+            ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        coordinates = {
+            image_id: (metadata["latitude"], metadata["longitude"])
+            for image_id, _, metadata in rows
+            if metadata and "latitude" in metadata and "longitude" in metadata
+        }
+        coordinates.update(
+            lookup_coordinates(
+                [image_id for image_id, _, _ in rows if image_id not in coordinates]
+            )
+        )
+
+        records = {}
+        for image_id, vector, metadata in rows:
+            if image_id not in coordinates:
+                skipped += 1
+                continue
+            latitude, longitude = coordinates[image_id]
+            name = partition_name(base, tile_for(latitude, longitude))
+            records.setdefault(name, []).append(
+                (
+                    image_id,
+                    np.asarray(vector),
+                    {**(metadata or {}), "latitude": latitude, "longitude": longitude},
+                )
+            )
+        for name, partition_records in records.items():
+            if name not in partitions:
+                partitions[name] = vx.get_or_create_collection(
+                    name=name, dimension=dimension
+                )
+            partitions[name].upsert(partition_records)
+            copied += len(partition_records)
+        print(f"Copied {copied} vectors into {len(partitions)} partitions.")
+
+    if skipped:
+        print(f"Skipped {skipped} vectors without coordinates.")
+    return list(partitions.values())
+
+
+def main():
+    from embedding_providers import PROVIDERS, get_embedding_provider
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["list", "split", "index"])
+    parser.add_argument("partitions", nargs="*", help="Partitions to index, or 'all'")
+    parser.add_argument(
+        "--provider",
+        choices=list(PROVIDERS),
+        help="Whose collection to work on; defaults to EMBEDDING_PROVIDER",
+    )
+    args = parser.parse_args()
+    if args.command == "index" and not args.partitions:
+        parser.error("index needs partition names or 'all'")
+    provider = get_embedding_provider(args.provider)
+    base = provider.collection_name
+
+    with vecs.create_client(settings.DB_CONNECTION_STRING) as vx:
+        partitions = [
+            collection
+            for collection in vx.list_collections()
+            if (parse_partition_name(collection.name) or ("",))[0] == base
+        ]
+        if args.command == "list":
+            for docs in sorted(partitions, key=lambda docs: docs.name):
+                print(f"{docs.name}\t{tile_bounds(parse_partition_name(docs.name)[1])}")
+        elif args.command == "split":
+            create_indexes(split_collection(vx, base, provider.dimension))
+        else:
+            if args.partitions != ["all"]:
+                unknown = set(args.partitions) - {docs.name for docs in partitions}
+                if unknown:
+                    parser.error(f"Unknown partitions: {sorted(unknown)}")
+                partitions = [
+                    docs for docs in partitions if docs.name in args.partitions
+                ]
+            create_indexes(partitions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import base64
+import gzip
+
+import brotli
+import numpy as np
+import orjson
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+# Columns of street_view_images that search results may be projected to
+SEARCH_COLUMNS = {
+    "image_id",
+    "image_url",
+    "latitude",
+    "longitude",
+    "heading",
+    "pitch",
+    "captured_at",
+    "fov",
+    "description",
+}
+# "fields=lean" returns just enough to place and show a marker
+LEAN_SEARCH_COLUMNS = ["image_id", "image_url", "latitude", "longitude"]
+# Always selected, since results are ranked and the heatmap is built from them
+REQUIRED_SEARCH_COLUMNS = ["image_id", "latitude", "longitude"]
+
+# Payloads smaller than this aren't worth the compression CPU
+MIN_COMPRESSION_SIZE = 1024
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 5
+
+
+def search_columns(fields):
+    """
+    Turn the comma-separated `fields` query parameter into a PostgREST select.
+    """
+    if not fields or fields == "*":
+        return "*"
+    if fields == "lean":
+        return ",".join(LEAN_SEARCH_COLUMNS)
+
+    columns = [column.strip() for column in fields.split(",") if column.strip()]
+    unknown = [column for column in columns if column not in SEARCH_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    for column in REQUIRED_SEARCH_COLUMNS:
+        if column not in columns:
+            columns.append(column)
+    return ",".join(columns)
+
+
+def encode_heatmap(heatmap_data, heatmap_format):
+    """
+    Heatmap points as JSON triples, or as base64 of packed little-endian
+    float32 (lat, lon, score) triples when heatmap_format is "f32".
+    """
+    if heatmap_format == "f32":
+        packed = np.asarray(heatmap_data, dtype="<f4").reshape(-1, 3).tobytes()
+        return base64.b64encode(packed).decode("ascii")
+    return heatmap_data
+
+
+# Supported content codings, preferred in this order when equally acceptable
+COMPRESSIONS = ["br", "gzip"]
+
+
+def preferred_encoding(accept_encoding):
+    """
+    The supported coding with the highest q-value in an Accept-Encoding header,
+    with "*" standing in for codings not listed, or None for no compression.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in COMPRESSIONS:
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def json_response(request: Request, content):
+    """
+    Serialize with orjson and compress with brotli or gzip, whichever the
+    client prefers (brotli on a tie).
+    """
+    body = orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    headers = {"Vary": "Accept-Encoding"}
+
+    if len(body) >= MIN_COMPRESSION_SIZE:
+        encoding = preferred_encoding(request.headers.get("accept-encoding", ""))
+        if encoding == "br":
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+            headers["Content-Encoding"] = "br"
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,165 @@
+"""
+Local pipeline state for vision.py: the image URL -> Gemini file name mapping
+and where each image is in the upload/caption/store pipeline, kept in SQLite
+(WAL mode) so lookups are indexed and updates are batched transactions.
+
+Import an existing image_mappings.json once with:
+    python state_store.py import image_mappings.json
+"""
+
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+STATE_DB = Path("image_state.db")
+MAPPINGS_FILE = Path("image_mappings.json")
+
+# Pipeline stages, in order. An image with an empty file_name is still "new".
+NEW = "new"
+UPLOADED = "uploaded"
+CAPTIONED = "captioned"
+CAPTION_FAILED = "caption_failed"
+STORED = "stored"
+
+# Stay under SQLite's default limit on bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+class ImageStateStore:
+    def __init__(self, path=STATE_DB):
+        # Several async_vision.py subprocesses may read while vision.py writes
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                image_url TEXT PRIMARY KEY,
+                file_name TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL DEFAULT 'new',
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+            """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS images_status ON images (status)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        self.conn.close()
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def add_urls(self, image_urls):
+        """
+        Register URLs not seen before, returning how many were new.
+        """
+        now = time.time()
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO images (image_url, updated_at) VALUES (?, ?)",
+                [(url, now) for url in image_urls],
+            )
+            return self.conn.total_changes - before
+
+    def set_file_names(self, mappings):
+        """
+        Record {image_url: file_name} for a batch of uploads in one transaction.
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO images (image_url, file_name, status, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (image_url) DO UPDATE SET
+                    file_name = excluded.file_name,
+                    status = excluded.status,
+                    error = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                [(url, name, UPLOADED, now) for url, name in mappings.items()],
+            )
+
+    def set_status(self, image_urls, status, error=None):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE images SET status = ?, error = ?, updated_at = ? "
+                "WHERE image_url = ?",
+                [(status, error, now, url) for url in image_urls],
+            )
+
+    def set_failed(self, errors, status=CAPTION_FAILED):
+        """
+        Record {image_url: error} for a batch of failed images in one transaction.
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE images SET status = ?, error = ?, updated_at = ? "
+                "WHERE image_url = ?",
+                [(status, error, now, url) for url, error in errors.items()],
+            )
+
+    def file_names(self, image_urls):
+        """
+        {image_url: file_name} for the given URLs that have been uploaded.
+        """
+        image_urls = list(image_urls)
+        mappings = {}
+        for i in range(0, len(image_urls), LOOKUP_BATCH_SIZE):
+            batch = image_urls[i : i + LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                "SELECT image_url, file_name FROM images "
+                f"WHERE image_url IN ({placeholders}) AND file_name != ''",
+                batch,
+            )
+            mappings.update(rows)
+        return mappings
+
+    def urls_without_file(self):
+        rows = self.conn.execute("SELECT image_url FROM images WHERE file_name = ''")
+        return [row[0] for row in rows]
+
+    def status_counts(self):
+        rows = self.conn.execute(
+            "SELECT status, COUNT(*) FROM images GROUP BY status ORDER BY status"
+        )
+        return dict(rows)
+
+    def import_mappings(self, mappings_file=MAPPINGS_FILE):
+        """
+        One-shot import of an image_mappings.json ({image_url: file_name}).
+        """
+        with open(mappings_file, "r") as f:
+            image_mappings = json.load(f)
+
+        self.add_urls(image_mappings)
+        self.set_file_names(
+            {url: file_name for url, file_name in image_mappings.items() if file_name}
+        )
+        return len(image_mappings)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "stats"):
+        print("Usage: python state_store.py import [image_mappings.json] | stats")
+        sys.exit(1)
+
+    with ImageStateStore() as store:
+        if sys.argv[1] == "import":
+            mappings_file = Path(sys.argv[2]) if len(sys.argv) > 2 else MAPPINGS_FILE
+            imported = store.import_mappings(mappings_file)
+            print(f"Imported {imported} URLs from {mappings_file} into {STATE_DB}")
+        print(store.status_counts())
@@ -0,0 +1,17 @@
+import os
+import sys
+from pathlib import Path
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Settings are required at import time; the tests never reach these services
+for name, value in {
+    "COHERE_API_KEY": "test",
+    "GEMINI_API_KEY": "test",
+    "SUPABASE_URL": "http://supabase.test",
+    "SUPABASE_KEY": "test.test.test",
+    "DB_CONNECTION_STRING": "postgresql://test",
+    "BACKEND_URL": "http://backend.test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,47 @@
+import json
+
+from async_vision import parse_batch_captions, process_caption
+
+IMAGE_IDS = {"image_1": "https://a.jpg", "image_2": "https://b.jpg"}
+
+
+def test_maps_ids_to_urls():
+    text = json.dumps(
+        [
+            {"id": "image_1", "caption": "A red tram.\nOn King Street."},
+            {"id": "image_2", "caption": "A quiet park."},
+        ]
+    )
+    assert parse_batch_captions(text, IMAGE_IDS) == {
+        "https://a.jpg": "A red tram. On King Street.",
+        "https://b.jpg": "A quiet park.",
+    }
+
+
+def test_normalizes_like_single_image_captions():
+    caption = "Description: A red tram.\nOn King Street. "
+    text = json.dumps([{"id": "image_1", "caption": caption}])
+    assert parse_batch_captions(text, IMAGE_IDS) == {
+        "https://a.jpg": process_caption(caption)
+    }
+
+
+def test_drops_unknown_repeated_and_empty_ids():
+    text = json.dumps(
+        [
+            {"id": "image_9", "caption": "Not in this batch."},
+            {"id": "image_1", "caption": "First."},
+            {"id": "image_1", "caption": "Second."},
+            {"id": "image_2", "caption": "  "},
+            {"id": "", "caption": "No id."},
+            {"caption": "Missing id."},
+            "not an object",
+        ]
+    )
+    assert parse_batch_captions(text, IMAGE_IDS) == {}
+
+
+def test_rejects_invalid_or_non_list_json():
+    assert parse_batch_captions("not json", IMAGE_IDS) == {}
+    assert parse_batch_captions('{"id": "image_1", "caption": "x"}', IMAGE_IDS) == {}
+    assert parse_batch_captions("null", IMAGE_IDS) == {}
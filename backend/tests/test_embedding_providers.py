@@ -0,0 +1,17 @@
+import pytest
+
+from embedding_providers import EmbeddingProvider, get_embedding_provider
+
+
+def test_incomplete_provider_fails_on_creation():
+    class QueriesOnly(EmbeddingProvider):
+        def embed_queries(self, texts):
+            return [[0.0] for _ in texts]
+
+    with pytest.raises(TypeError):
+        QueriesOnly()
+
+
+def test_unknown_provider_name():
+    with pytest.raises(ValueError):
+        get_embedding_provider("nope")
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from heatmap import MAX_ZOOM, MIN_ZOOM, HeatmapGrid
+
+WORLD = (-85, -180, 85, 180)
+
+
+@pytest.fixture
+def grid():
+    rng = np.random.default_rng(0)
+    latitudes = rng.uniform(43.63, 43.67, 500)
+    longitudes = rng.uniform(-79.41, -79.37, 500)
+    scores = rng.uniform(0.25, 1, 500)
+    return HeatmapGrid(latitudes, longitudes, scores), scores
+
+
+def test_cells_conserve_counts_and_weights(grid):
+    grid, scores = grid
+    assert grid.candidates == len(scores)
+    for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+        points, counts = grid.cells(zoom, *WORLD)
+        assert counts.sum() == len(scores)
+        assert points[:, 2].sum() == pytest.approx(scores.sum())
+
+
+def test_cells_clip_to_viewport(grid):
+    grid, _ = grid
+    south, west, north, east = 43.64, -79.40, 43.65, -79.39
+    points, counts = grid.cells(16, south, west, north, east)
+    all_points, all_counts = grid.cells(16, *WORLD)
+
+    assert 0 < counts.sum() < all_counts.sum()
+    # Cell centers lie within one cell of the viewport
+    cell_degrees = 360 / (16 << 16)
+    assert np.all(points[:, 0] >= south - cell_degrees)
+    assert np.all(points[:, 0] <= north + cell_degrees)
+    assert np.all(points[:, 1] >= west - cell_degrees)
+    assert np.all(points[:, 1] <= east + cell_degrees)
+
+
+def test_empty_grid():
+    grid = HeatmapGrid(np.empty(0), np.empty(0), np.empty(0))
+    points, counts = grid.cells(14, *WORLD)
+    assert grid.candidates == 0
+    assert points.shape == (0, 3)
+    assert len(counts) == 0
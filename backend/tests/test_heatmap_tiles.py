@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def built(monkeypatch):
+    viewports = []
+
+    def build_heatmap_grid(q, min_score, candidates, viewport):
+        viewports.append(viewport)
+        return main.HeatmapGrid(np.array([43.65]), np.array([-79.39]), np.array([1.0]))
+
+    monkeypatch.setattr(main, "build_heatmap_grid", build_heatmap_grid)
+    monkeypatch.setattr(main.settings, "VECTOR_PARTITIONING", True)
+    monkeypatch.setattr(main.settings, "PARTITION_TILE_DEGREES", 0.1)
+    main.heatmap_grid_cache.clear()
+    yield viewports
+    main.heatmap_grid_cache.clear()
+
+
+def viewport(south, west, north, east):
+    return {"south": south, "west": west, "north": north, "east": east}
+
+
+def test_grid_is_reused_within_the_same_tiles(built):
+    client = TestClient(main.app)
+    params = {"q": "Cozy cafe"}
+    assert (
+        client.get(
+            "/heatmap_tiles",
+            params={**params, **viewport(43.64, -79.39, 43.65, -79.38)},
+        ).status_code
+        == 200
+    )
+    client.get(
+        "/heatmap_tiles", params={**params, **viewport(43.62, -79.35, 43.63, -79.34)}
+    )
+    assert len(built) == 1
+
+    # Panning into another city's tiles builds a grid from those partitions
+    client.get(
+        "/heatmap_tiles", params={**params, **viewport(45.50, -73.58, 45.51, -73.57)}
+    )
+    assert len(built) == 2
+    assert built[1].south == 45.50
@@ -0,0 +1,48 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import decode_cursor, encode_cursor
+from partitions import BoundingBox
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode()
+
+
+def test_round_trip_without_bbox():
+    assert decode_cursor(encode_cursor("token", 100, "Cozy cafe")) == (
+        "token",
+        100,
+        "Cozy cafe",
+        None,
+    )
+
+
+def test_round_trip_with_bbox():
+    bbox = BoundingBox(43.637794, -79.403619, 43.670535, -79.374303)
+    token, offset, q, decoded = decode_cursor(encode_cursor("token", 5, "q", bbox))
+    assert decoded == bbox
+    assert isinstance(decoded, BoundingBox)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        raw_cursor({"t": "token", "o": -1, "q": "q"}),
+        raw_cursor({"t": ["token"], "o": 0, "q": "q"}),
+        raw_cursor({"t": {"a": 1}, "o": 0, "q": "q"}),
+        raw_cursor({"t": "token", "o": 0, "q": ["q"]}),
+        raw_cursor({"t": "token", "o": "many", "q": "q"}),
+        raw_cursor({"t": "token", "o": 0}),
+        raw_cursor({"t": "token", "o": 0, "q": "q", "b": [1, 2]}),
+        raw_cursor(["token", 0, "q"]),
+    ],
+)
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
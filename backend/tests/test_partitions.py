@@ -0,0 +1,94 @@
+import argparse
+from types import SimpleNamespace
+
+import pytest
+
+import partitions
+from partitions import (
+    BoundingBox,
+    open_collections,
+    overlaps,
+    parse_partition_name,
+    partition_name,
+    tile_bounds,
+    tile_for,
+    tile_range,
+)
+
+DOWNTOWN = BoundingBox(43.637794, -79.403619, 43.670535, -79.374303)
+WORLD = BoundingBox(-90, -180, 90, 180)
+
+
+class ListingClient:
+    def __init__(self, names):
+        self.names = names
+
+    def list_collections(self):
+        return [SimpleNamespace(name=name) for name in self.names]
+
+
+@pytest.fixture
+def partitioning(monkeypatch):
+    monkeypatch.setattr(partitions.settings, "VECTOR_PARTITIONING", True)
+    monkeypatch.setattr(partitions.settings, "PARTITION_TILE_DEGREES", 0.1)
+
+
+def test_tile_bounds_contain_their_points(partitioning):
+    tile = tile_for(43.65, -79.39)
+    bounds = tile_bounds(tile)
+    assert bounds.south <= 43.65 < bounds.north
+    assert bounds.west <= -79.39 < bounds.east
+
+
+def test_partition_names_round_trip():
+    name = partition_name("image_embeddings_bge_small_en_v1_5", (1006, 1336))
+    assert parse_partition_name(name) == (
+        "image_embeddings_bge_small_en_v1_5",
+        (1006, 1336),
+    )
+    assert parse_partition_name("image_embeddings") is None
+
+
+def test_overlaps_matches_tile_for(partitioning):
+    assert tile_range(DOWNTOWN) == (1005, 1336, 1006, 1336)
+    assert overlaps((1005, 1336), DOWNTOWN)
+    assert overlaps((1006, 1336), DOWNTOWN)
+    assert not overlaps((1007, 1336), DOWNTOWN)
+    assert not overlaps((1006, 1337), DOWNTOWN)
+
+
+def test_open_collections_routes_to_existing_partitions(partitioning):
+    vx = ListingClient(
+        [
+            partition_name("image_embeddings", (1005, 1336)),
+            partition_name("image_embeddings", (1006, 1336)),
+            partition_name("image_embeddings", (1010, 1340)),
+            partition_name("image_embeddings_other", (1006, 1336)),
+            "image_embeddings",
+        ]
+    )
+    names = [docs.name for docs in open_collections(vx, "image_embeddings", 1024)]
+    assert len(names) == 3
+
+    names = [
+        docs.name for docs in open_collections(vx, "image_embeddings", 1024, DOWNTOWN)
+    ]
+    assert names == [
+        "image_embeddings__p1005_1336",
+        "image_embeddings__p1006_1336",
+    ]
+
+
+def test_world_bbox_with_small_tiles_is_cheap(partitioning, monkeypatch):
+    monkeypatch.setattr(partitions.settings, "PARTITION_TILE_DEGREES", 0.001)
+    vx = ListingClient([partition_name("image_embeddings", (100_000, 50_000))])
+    assert len(open_collections(vx, "image_embeddings", 1024, WORLD)) == 1
+
+
+def test_parse_bbox():
+    assert partitions.parse_bbox("43.6,-79.4,43.7,-79.3") == BoundingBox(
+        43.6, -79.4, 43.7, -79.3
+    )
+    for value in ["43.6,-79.4,43.7", "a,b,c,d", "44,-79.4,43,-79.3", "0,0,91,1"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            partitions.parse_bbox(value)
@@ -0,0 +1,60 @@
+import base64
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from responses import (
+    REQUIRED_SEARCH_COLUMNS,
+    encode_heatmap,
+    preferred_encoding,
+    search_columns,
+)
+
+
+def test_search_columns_defaults_and_lean():
+    assert search_columns(None) == "*"
+    assert search_columns("*") == "*"
+    assert search_columns("lean") == "image_id,image_url,latitude,longitude"
+
+
+def test_search_columns_appends_required_columns():
+    columns = search_columns("description, heading").split(",")
+    assert columns[:2] == ["description", "heading"]
+    assert set(REQUIRED_SEARCH_COLUMNS) <= set(columns)
+    assert len(columns) == len(set(columns))
+
+
+def test_search_columns_rejects_unknown_fields():
+    with pytest.raises(HTTPException) as error:
+        search_columns("image_url,password")
+    assert error.value.status_code == 400
+    assert "password" in error.value.detail
+
+
+def test_encode_heatmap_f32_packs_12_bytes_per_point():
+    points = [(43.65, -79.38, 0.5), (43.66, -79.39, 0.25)]
+    packed = base64.b64decode(encode_heatmap(points, "f32"))
+    assert len(packed) == 12 * len(points)
+    np.testing.assert_allclose(
+        np.frombuffer(packed, dtype="<f4").reshape(-1, 3), points, rtol=1e-6
+    )
+    assert encode_heatmap(points, "json") is points
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("", None),
+        ("gzip, deflate, br", "br"),
+        ("gzip", "gzip"),
+        ("br;q=0.1, gzip;q=1.0", "gzip"),
+        ("br;q=0, gzip", "gzip"),
+        ("*", "br"),
+        ("*;q=0.5, br;q=0", "gzip"),
+        ("identity", None),
+        ("gzip;q=0", None),
+    ],
+)
+def test_preferred_encoding(header, expected):
+    assert preferred_encoding(header) == expected
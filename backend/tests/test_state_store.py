@@ -0,0 +1,54 @@
+import json
+
+from state_store import (
+    CAPTION_FAILED,
+    CAPTIONED,
+    NEW,
+    STORED,
+    UPLOADED,
+    ImageStateStore,
+)
+
+
+def test_import_and_file_names(tmp_path):
+    mappings_file = tmp_path / "image_mappings.json"
+    mappings_file.write_text(
+        json.dumps({"https://a.jpg": "files/a", "https://b.jpg": ""})
+    )
+
+    with ImageStateStore(tmp_path / "state.db") as store:
+        assert store.import_mappings(mappings_file) == 2
+        assert store.count() == 2
+        assert store.file_names(
+            ["https://a.jpg", "https://b.jpg", "https://c.jpg"]
+        ) == {"https://a.jpg": "files/a"}
+        assert store.urls_without_file() == ["https://b.jpg"]
+        assert store.status_counts() == {NEW: 1, UPLOADED: 1}
+
+
+def test_add_urls_counts_only_new(tmp_path):
+    with ImageStateStore(tmp_path / "state.db") as store:
+        assert store.add_urls(["https://a.jpg", "https://b.jpg"]) == 2
+        assert store.add_urls(["https://b.jpg", "https://c.jpg"]) == 1
+
+
+def test_status_transitions(tmp_path):
+    urls = ["https://a.jpg", "https://b.jpg", "https://c.jpg"]
+    with ImageStateStore(tmp_path / "state.db") as store:
+        store.add_urls(urls)
+        store.set_file_names({url: f"files/{i}" for i, url in enumerate(urls)})
+        assert store.status_counts() == {UPLOADED: 3}
+
+        store.set_status(urls[:2], CAPTIONED)
+        store.set_failed({urls[2]: "timeout"}, CAPTION_FAILED)
+        store.set_status(urls[:2], STORED)
+        assert store.status_counts() == {CAPTION_FAILED: 1, STORED: 2}
+
+        error = store.conn.execute(
+            "SELECT error FROM images WHERE image_url = ?", (urls[2],)
+        ).fetchone()[0]
+        assert error == "timeout"
+
+        # A re-upload clears the failure
+        store.set_file_names({urls[2]: "files/retry"})
+        assert store.status_counts() == {UPLOADED: 1, STORED: 2}
@@ -1,3 +1,4 @@
+import argparse
 import sys
 import subprocess
 import json
@@ -5,49 +6,42 @@ from pathlib import Path
 import requests
 from supabase import Client, create_client
 from config import settings
+from partitions import parse_bbox
 import time
+from state_store import (
+    CAPTION_FAILED,
+    CAPTIONED,
+    MAPPINGS_FILE,
+    STATE_DB,
+    STORED,
+    ImageStateStore,
+)
 
 supabase_url = settings.SUPABASE_URL
 supabase_key = settings.SUPABASE_KEY
 supabase: Client = create_client(supabase_url, supabase_key)
 
-MAPPINGS_FILE = Path("image_mappings.json")
 
-
-def fetch_image_data():
+def fetch_image_data(bbox=None):
     url = f"{settings.BACKEND_URL}/street_view_images_without_description"
-    response = requests.get(url)
+    response = requests.get(url, params=bbox._asdict() if bbox else None)
     if response.status_code != 200:
         raise Exception(f"Failed to fetch image data: {response.status_code}")
     data = response.json()
     return data
 
 
-def save_mappings(image_mappings):
-    with open(MAPPINGS_FILE, "w") as f:
-        json.dump(image_mappings, f, indent=2)
-
-
-def create_image_mappings(image_data):
-    if MAPPINGS_FILE.exists():
-        with open(MAPPINGS_FILE, "r") as f:
-            image_mappings = json.load(f)
-    else:
-        image_mappings = {}
+def create_image_mappings(store, image_data):
+    if store.count() == 0 and MAPPINGS_FILE.exists():
+        imported = store.import_mappings(MAPPINGS_FILE)
+        print(f"Imported {imported} URLs from {MAPPINGS_FILE}")
 
-    new_urls = 0
-    for img in image_data:
-        if img["image_url"] not in image_mappings:
-            image_mappings[img["image_url"]] = ""
-            new_urls += 1
+    new_urls = store.add_urls(img["image_url"] for img in image_data)
 
-    save_mappings(image_mappings)
+    print(f"Updated {STATE_DB} with {new_urls} new URLs")
 
-    print(f"Updated {MAPPINGS_FILE} with {new_urls} new URLs")
-    return image_mappings
 
-
-def upload_images(image_mappings, image_urls, batch_size=24):
+def upload_images(store, image_urls, batch_size=24):
     total_images = len(image_urls)
     all_responses = []
 
@@ -89,15 +83,11 @@ def upload_images(image_mappings, image_urls, batch_size=24):
         batch_duration = batch_end_time - batch_start_time
         print(f"Batch {batch_number} completed in {batch_duration:.2f} seconds.")
 
-        successful_urls = [
-            (url, file_name) for url, file_name in batch_responses.items() if file_name
-        ]
-        for url, file_name in successful_urls:
-            image_mappings[url] = file_name
-        print(f"Updated {len(successful_urls)} URLs in image_mappings.json")
-        save_mappings(image_mappings)
-
-    return image_mappings
+        successful_urls = {
+            url: file_name for url, file_name in batch_responses.items() if file_name
+        }
+        store.set_file_names(successful_urls)
+        print(f"Updated {len(successful_urls)} URLs in {STATE_DB}")
 
 
 def process_images(image_data, batch_size=100):
@@ -150,48 +140,79 @@ def update_description_in_db(image_url, description):
             .eq("image_url", image_url)
             .execute()
         )
+        return True
     except Exception as e:
         print(f"Error updating database for image {image_url}: {e}")
+        return False
 
 
-def main():
+def main(bbox=None):
     print(f"Running vision.py")
 
-    image_data = fetch_image_data()
+    image_data = fetch_image_data(bbox)
 
     if not image_data:
         print("No image data fetched from the API.")
         sys.exit(1)
 
-    print("Creating image mappings...")
-    image_mappings = create_image_mappings(image_data)
-    print("Image mappings created.")
-
-    image_urls = [url for url, filename in image_mappings.items() if not filename]
-    print(f"Number of images to upload: {len(image_urls)}")
-    print("Uploading images...")
-    image_mappings = upload_images(image_mappings, image_urls)
-    print("Images uploaded.")
-
-    print("Processing images...")
-    responses = process_images(image_data)
-    print("All batches processed.")
-    print(f"Total responses: {len(responses)}")
-    print(
-        f"Number of responses with non empty description: {len([response for response in responses if response['description']])}"
-    )
+    with ImageStateStore() as store:
+        print("Creating image mappings...")
+        create_image_mappings(store, image_data)
+        print("Image mappings created.")
+
+        image_urls = store.urls_without_file()
+        print(f"Number of images to upload: {len(image_urls)}")
+        print("Uploading images...")
+        upload_images(store, image_urls)
+        print("Images uploaded.")
+
+        print("Processing images...")
+        responses = process_images(image_data)
+        print("All batches processed.")
+        print(f"Total responses: {len(responses)}")
+        print(
+            f"Number of responses with non empty description: {len([response for response in responses if response['description']])}"
+        )
 
-    with open("responses_again.json", "w") as f:
-        json.dump(responses, f)
-    print("Responses saved!")
+        with open("responses_again.json", "w") as f:
+            json.dump(responses, f)
+        store.set_status(
+            [
+                response["image_url"]
+                for response in responses
+                if response["description"]
+            ],
+            CAPTIONED,
+        )
+        store.set_failed(
+            {
+                response["image_url"]: response.get("error")
+                for response in responses
+                if not response["description"]
+            },
+            CAPTION_FAILED,
+        )
+        print("Responses saved!")
 
-    print("Updating database...")
-    for response in responses:
-        image_url = response["image_url"]
-        description = response["description"]
-        update_description_in_db(image_url, description)
-    print("Database updated.")
+        print("Updating database...")
+        stored_urls = []
+        for response in responses:
+            image_url = response["image_url"]
+            description = response["description"]
+            # Failed captions keep their caption_failed status and are retried later
+            if description and update_description_in_db(image_url, description):
+                stored_urls.append(image_url)
+        store.set_status(stored_urls, STORED)
+        print("Database updated.")
+        print(f"Pipeline state: {store.status_counts()}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--bbox",
+        type=parse_bbox,
+        metavar="S,W,N,E",
+        help="Caption the images in this area; defaults to the API's downtown box",
+    )
+    main(parser.parse_args().bbox)